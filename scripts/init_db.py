@@ -1,6 +1,7 @@
 # scripts/init_db.py
 import os
 import sys
+import asyncio
 import logging
 
 # Add src to path
@@ -11,17 +12,19 @@ from src.database.models import DatabaseManager
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def initialize_database():
+async def initialize_database():
     """Initialize the database tables"""
+    db_manager = DatabaseManager()
     try:
-        db_manager = DatabaseManager()
-        db_manager.init_db()
+        await db_manager.init_db()
         logger.info("✅ Database initialized successfully")
         return True
     except Exception as e:
         logger.error(f"❌ Failed to initialize database: {e}")
         return False
+    finally:
+        await db_manager.close_pool()
 
 if __name__ == "__main__":
-    success = initialize_database()
+    success = asyncio.run(initialize_database())
     sys.exit(0 if success else 1)
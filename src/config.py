@@ -0,0 +1,6 @@
+# src/config.py
+import os
+from arq.connections import RedisSettings
+
+# Shared by the web app (enqueues jobs) and the arq worker (runs them)
+REDIS_SETTINGS = RedisSettings.from_dsn(os.getenv('REDIS_URL', 'redis://localhost:6379'))
@@ -1,85 +1,319 @@
 # src/database/models.py
 import os
-import psycopg2
-from psycopg2.extras import RealDictCursor
-from datetime import datetime
-from contextlib import contextmanager
+import asyncio
+import orjson
+import asyncpg
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Hot per-profile statements, run as plain SQL by name. They rely on
+# asyncpg's per-connection statement cache, which prepares each one on first
+# use; don't prepare them in the pool init hook, since a PreparedStatement is
+# invalidated once its connection goes back to the pool
+HOT_STATEMENTS = {
+    # Compares the new counts against the latest snapshot server-side and
+    # returns only the metrics that moved by at least the threshold ($11, in
+    # basis points, using the same integer rule as calculate_changes)
+    'upsert_and_fetch_last': """
+        WITH upsert AS (
+            INSERT INTO profiles 
+            (username, profile_id, display_name, bio, avatar_url, verified, last_checked)
+            VALUES ($1, $2, $3, $4, $5, $6, CURRENT_TIMESTAMP)
+            ON CONFLICT (username) DO UPDATE SET last_checked = CURRENT_TIMESTAMP
+            RETURNING id
+        )
+        SELECT upsert.id AS profile_id, last_snap.id, last_snap.snapshot_timestamp,
+               anchor.id AS anchor_snapshot_id, diff.changes
+        FROM upsert
+        LEFT JOIN LATERAL (
+            SELECT id, followers_count, following_count, likes_count, video_count,
+                   snapshot_timestamp
+            FROM profile_snapshots 
+            WHERE profile_id = upsert.id 
+            ORDER BY snapshot_timestamp DESC 
+            LIMIT 1
+        ) last_snap ON TRUE
+        LEFT JOIN LATERAL (
+            SELECT id FROM profile_snapshots 
+            WHERE profile_id = upsert.id AND raw_data_first_id IS NULL 
+            ORDER BY snapshot_timestamp 
+            LIMIT 1
+        ) anchor ON TRUE
+        LEFT JOIN LATERAL (
+            SELECT COALESCE(jsonb_object_agg(m.metric, jsonb_build_object(
+                       'old_value', m.old_value,
+                       'new_value', m.new_value,
+                       'absolute_change', m.new_value - m.old_value,
+                       'percentage_change', CASE WHEN m.old_value = 0 THEN 100.0
+                           ELSE (m.new_value - m.old_value) * 100.0 / m.old_value END
+                   )), '{}'::jsonb) AS changes
+            FROM (VALUES
+                ('followers_count', COALESCE(last_snap.followers_count, 0), COALESCE($7::integer, 0)),
+                ('following_count', COALESCE(last_snap.following_count, 0), COALESCE($8::integer, 0)),
+                ('likes_count', COALESCE(last_snap.likes_count, 0), COALESCE($9::integer, 0)),
+                ('video_count', COALESCE(last_snap.video_count, 0), COALESCE($10::integer, 0))
+            ) AS m(metric, old_value, new_value)
+            WHERE last_snap.id IS NOT NULL
+              AND ((m.old_value = 0 AND m.new_value > 0)
+                   OR (m.old_value > 0
+                       AND abs(m.new_value - m.old_value)::bigint * 10000
+                           >= $11::bigint * m.old_value))
+        ) diff ON TRUE
+    """,
+    # Only what change detection reads; raw_data can be 100KB+ per row
+    'last_snapshot': """
+        SELECT id, followers_count, following_count, likes_count, video_count,
+               snapshot_timestamp
+        FROM profile_snapshots 
+        WHERE profile_id = $1 
+        ORDER BY snapshot_timestamp DESC 
+        LIMIT 1
+    """,
+    # The snapshot holding a profile's full raw_data; later snapshots store
+    # a JSON patch against it
+    'anchor_snapshot': """
+        SELECT id FROM profile_snapshots 
+        WHERE profile_id = $1 AND raw_data_first_id IS NULL 
+        ORDER BY snapshot_timestamp 
+        LIMIT 1
+    """,
+    'insert_snapshot': """
+        INSERT INTO profile_snapshots 
+        (profile_id, followers_count, following_count, likes_count, 
+         video_count, change_detected, previous_snapshot_id, raw_data, raw_data_first_id)
+        VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9)
+        RETURNING id
+    """,
+}
+
+async def _init_connection(conn):
+    """Prepare every pooled connection for use"""
+    # Binary format so COPY (which is always binary) can encode jsonb too;
+    # the wire format is a version byte followed by the JSON text
+    await conn.set_type_codec(
+        'jsonb',
+        encoder=lambda value: b'\x01' + orjson.dumps(value),
+        decoder=lambda data: orjson.loads(data[1:]),
+        schema='pg_catalog',
+        format='binary'
+    )
+
 class DatabaseManager:
     def __init__(self):
         self.database_url = os.getenv('DATABASE_URL')
+        self.pool_min_size = int(os.getenv('DB_POOL_MIN_SIZE', '4'))
+        self.pool_max_size = int(os.getenv('DB_POOL_MAX_SIZE', '32'))
+        self.monitored_ttl_days = int(os.getenv('MONITORED_PROFILES_TTL_DAYS', '30'))
+        self.pool = None
+        self._pool_lock = asyncio.Lock()
+
+    async def init_pool(self):
+        """Create the shared connection pool, held for the process lifetime"""
+        # Concurrent first callers must not each create their own pool
+        async with self._pool_lock:
+            if self.pool is None:
+                self.pool = await asyncpg.create_pool(
+                    dsn=self.database_url,
+                    min_size=self.pool_min_size,
+                    max_size=self.pool_max_size,
+                    init=_init_connection
+                )
+        return self.pool
+
+    async def close_pool(self):
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+
+    async def fetch(self, sql, *args):
+        async with self.pool.acquire() as conn:
+            return await conn.fetch(sql, *args)
+
+    async def fetchrow(self, sql, *args):
+        async with self.pool.acquire() as conn:
+            return await conn.fetchrow(sql, *args)
+
+    async def fetchval(self, sql, *args):
+        async with self.pool.acquire() as conn:
+            return await conn.fetchval(sql, *args)
+
+    async def execute(self, sql, *args):
+        async with self.pool.acquire() as conn:
+            return await conn.execute(sql, *args)
+
+    async def fetchrow_named(self, name, *args):
+        """Run a HOT_STATEMENTS entry by name"""
+        async with self.pool.acquire() as conn:
+            return await conn.fetchrow(HOT_STATEMENTS[name], *args)
+
+    async def fetchval_named(self, name, *args):
+        async with self.pool.acquire() as conn:
+            return await conn.fetchval(HOT_STATEMENTS[name], *args)
+
+    async def copy_records(self, table, records, columns):
+        """Bulk-insert records with a single COPY"""
+        async with self.pool.acquire() as conn:
+            return await conn.copy_records_to_table(table, records=records, columns=columns)
+
+    async def upsert_and_fetch_last(self, username, profile_data, threshold_bp):
+        """Upsert a profile and diff it against its latest snapshot in one round-trip
         
-    @contextmanager
-    def get_connection(self):
-        conn = None
-        try:
-            conn = psycopg2.connect(self.database_url)
-            yield conn
-        except Exception as e:
-            logger.error(f"Database connection error: {e}")
-            if conn:
-                conn.rollback()
-            raise
-        finally:
-            if conn:
-                conn.close()
-    
-    @contextmanager
-    def get_cursor(self, commit=False):
-        with self.get_connection() as conn:
-            cursor = conn.cursor(cursor_factory=RealDictCursor)
-            try:
-                yield cursor
-                if commit:
-                    conn.commit()
-            except Exception as e:
-                conn.rollback()
-                logger.error(f"Database cursor error: {e}")
-                raise
-            finally:
-                cursor.close()
-
-    def init_db(self):
-        """Initialize database tables"""
-        with self.get_cursor(commit=True) as cur:
-            # Create profiles table
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS profiles (
-                    id SERIAL PRIMARY KEY,
-                    username VARCHAR(100) UNIQUE NOT NULL,
-                    profile_id VARCHAR(100) UNIQUE,
-                    display_name VARCHAR(200),
-                    bio TEXT,
-                    avatar_url TEXT,
-                    verified BOOLEAN DEFAULT FALSE,
-                    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
-                    last_checked TIMESTAMP WITH TIME ZONE,
-                    is_active BOOLEAN DEFAULT TRUE
+        Returns (profile_id, last_snapshot, changes), where last_snapshot
+        holds only id, snapshot_timestamp and anchor_snapshot_id (None if
+        the profile has no snapshots yet) and changes maps each metric that
+        moved by at least threshold_bp basis points to its old/new values.
+        """
+        row = await self.fetchrow_named(
+            'upsert_and_fetch_last',
+            username.lower(),
+            profile_data.get('profile_id'),
+            profile_data.get('display_name'),
+            profile_data.get('bio'),
+            profile_data.get('avatar_url'),
+            profile_data.get('verified', False),
+            profile_data.get('followers_count'),
+            profile_data.get('following_count'),
+            profile_data.get('likes_count'),
+            profile_data.get('video_count'),
+            threshold_bp
+        )
+        last_snapshot = row if row['id'] is not None else None
+        return row['profile_id'], last_snapshot, row['changes']
+
+    async def set_monitored_profiles(self, session_id, usernames):
+        """Replace a session's monitored usernames, keeping their order"""
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute(
+                    "DELETE FROM monitored_profiles WHERE session_id = $1",
+                    session_id
                 )
-            """)
-            
-            # Create profile_snapshots table
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS profile_snapshots (
-                    id SERIAL PRIMARY KEY,
-                    profile_id INTEGER REFERENCES profiles(id),
-                    followers_count INTEGER,
-                    following_count INTEGER,
-                    likes_count INTEGER,
-                    video_count INTEGER,
-                    snapshot_timestamp TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
-                    change_detected BOOLEAN DEFAULT FALSE,
-                    previous_snapshot_id INTEGER REFERENCES profile_snapshots(id),
-                    raw_data JSONB
+                # seq is assigned in ordinality order, so reads keep input order
+                await conn.execute(
+                    """
+                    INSERT INTO monitored_profiles (session_id, username)
+                    SELECT $1, u.username
+                    FROM unnest($2::text[]) WITH ORDINALITY AS u(username, n)
+                    ORDER BY u.n
+                    ON CONFLICT DO NOTHING
+                    """,
+                    session_id, usernames
                 )
-            """)
-            
-            # Create indexes
-            cur.execute("CREATE INDEX IF NOT EXISTS idx_profiles_username ON profiles(username)")
-            cur.execute("CREATE INDEX IF NOT EXISTS idx_snapshots_profile_id ON profile_snapshots(profile_id)")
-            cur.execute("CREATE INDEX IF NOT EXISTS idx_snapshots_timestamp ON profile_snapshots(snapshot_timestamp)")
-            
-            logger.info("Database tables initialized successfully")
+
+    async def get_monitored_profiles(self, session_id):
+        """Get a session's monitored usernames in the order they were saved
+        
+        Reading marks the list as used, so it only expires once the session
+        stops using it.
+        """
+        rows = await self.fetch(
+            """
+            WITH used AS (
+                UPDATE monitored_profiles SET last_used_at = CURRENT_TIMESTAMP
+                WHERE session_id = $1
+                RETURNING username, seq
+            )
+            SELECT username FROM used ORDER BY seq
+            """,
+            session_id
+        )
+        return [row['username'] for row in rows]
+
+    async def expire_monitored_profiles(self):
+        """Drop monitored lists unused for monitored_ttl_days (abandoned sessions)"""
+        return await self.execute(
+            "DELETE FROM monitored_profiles WHERE last_used_at < NOW() - make_interval(days => $1)",
+            self.monitored_ttl_days
+        )
+
+    async def init_db(self):
+        """Initialize database tables"""
+        # One-off DDL runs over a plain connection rather than the pool
+        conn = await asyncpg.connect(self.database_url)
+        try:
+            async with conn.transaction():
+                # Create profiles table
+                await conn.execute("""
+                    CREATE TABLE IF NOT EXISTS profiles (
+                        id SERIAL PRIMARY KEY,
+                        username VARCHAR(100) UNIQUE NOT NULL,
+                        profile_id VARCHAR(100) UNIQUE,
+                        display_name VARCHAR(200),
+                        bio TEXT,
+                        avatar_url TEXT,
+                        verified BOOLEAN DEFAULT FALSE,
+                        created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+                        last_checked TIMESTAMP WITH TIME ZONE,
+                        is_active BOOLEAN DEFAULT TRUE
+                    )
+                """)
+
+                # Create profile_snapshots table
+                await conn.execute("""
+                    CREATE TABLE IF NOT EXISTS profile_snapshots (
+                        id SERIAL PRIMARY KEY,
+                        profile_id INTEGER REFERENCES profiles(id),
+                        followers_count INTEGER,
+                        following_count INTEGER,
+                        likes_count INTEGER,
+                        video_count INTEGER,
+                        snapshot_timestamp TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+                        change_detected BOOLEAN DEFAULT FALSE,
+                        previous_snapshot_id INTEGER REFERENCES profile_snapshots(id),
+                        raw_data JSONB,
+                        raw_data_first_id INTEGER REFERENCES profile_snapshots(id)
+                    )
+                """)
+                await conn.execute("""
+                    ALTER TABLE profile_snapshots
+                    ADD COLUMN IF NOT EXISTS raw_data_first_id INTEGER REFERENCES profile_snapshots(id)
+                """)
+
+                # lz4 compresses TOASTed raw_data much faster than the default
+                # pglz; needs PostgreSQL 14+ built with lz4, so failure is not fatal
+                try:
+                    async with conn.transaction():
+                        await conn.execute(
+                            "ALTER TABLE profile_snapshots ALTER COLUMN raw_data SET COMPRESSION lz4"
+                        )
+                except asyncpg.PostgresError as e:
+                    logger.warning(f"Keeping default raw_data compression: {e}")
+
+                # Create monitored_profiles table
+                await conn.execute("""
+                    CREATE TABLE IF NOT EXISTS monitored_profiles (
+                        session_id TEXT NOT NULL,
+                        username TEXT NOT NULL,
+                        added_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+                        seq BIGSERIAL,
+                        last_used_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+                        PRIMARY KEY (session_id, username)
+                    )
+                """)
+                await conn.execute(
+                    "ALTER TABLE monitored_profiles ADD COLUMN IF NOT EXISTS seq BIGSERIAL"
+                )
+                await conn.execute("""
+                    ALTER TABLE monitored_profiles
+                    ADD COLUMN IF NOT EXISTS last_used_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+                """)
+
+                # Create indexes
+                await conn.execute("CREATE INDEX IF NOT EXISTS idx_profiles_username ON profiles(username)")
+                # Latest-snapshot lookups are a single descent of this index; it
+                # also covers plain profile_id lookups, so the old index goes
+                await conn.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_snapshots_profile_time
+                    ON profile_snapshots(profile_id, snapshot_timestamp DESC)
+                """)
+                await conn.execute("DROP INDEX IF EXISTS idx_snapshots_profile_id")
+                # For expiring abandoned sessions' monitored lists
+                await conn.execute("DROP INDEX IF EXISTS idx_monitored_added_at")
+                await conn.execute("CREATE INDEX IF NOT EXISTS idx_monitored_last_used_at ON monitored_profiles(last_used_at)")
+                # Kept for the time-range count on /status
+                await conn.execute("CREATE INDEX IF NOT EXISTS idx_snapshots_timestamp ON profile_snapshots(snapshot_timestamp)")
+        finally:
+            await conn.close()
+
+        logger.info("Database tables initialized successfully")
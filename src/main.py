@@ -2,7 +2,8 @@
 import asyncio
 import os
 import logging
-from typing import List, Dict
+import uvloop
+from typing import List, Dict, Optional, Tuple
 from src.database.models import DatabaseManager
 from src.scraping.scrapfly_client import ScrapflyService
 from src.scraping.incremental_logic import IncrementalScraper
@@ -14,87 +15,167 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 class TikTokIncrementalScraper:
-    def __init__(self):
+    def __init__(self, batch_size: int = 500, workers: int = 32, queue_size: int = 1024):
         self.db_manager = DatabaseManager()
         self.scrapfly_service = ScrapflyService()
         self.incremental_logic = IncrementalScraper(self.db_manager)
+        self.batch_size = batch_size
+        self.workers = workers
+        self.queue_size = queue_size
     
     async def scrape_profiles(self, usernames: List[str]) -> List[Dict]:
-        """Main method to scrape multiple profiles with incremental logic"""
-        results = []
+        """Main method to scrape multiple profiles with incremental logic
         
-        for username in usernames:
+        Scrape workers pull usernames from one queue and push parsed profiles
+        onto a bounded second queue, which a single writer drains into the
+        database in batches, so HTTP latency and DB throughput don't block
+        each other.
+        """
+        in_q: asyncio.Queue = asyncio.Queue()
+        out_q: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        results: List[Optional[Dict]] = [None] * len(usernames)
+        
+        worker_count = min(self.workers, len(usernames))
+        for item in enumerate(usernames):
+            in_q.put_nowait(item)
+        for _ in range(worker_count):
+            in_q.put_nowait(None)
+        
+        workers = [
+            asyncio.create_task(self._scrape_worker(in_q, out_q, results))
+            for _ in range(worker_count)
+        ]
+        writer = asyncio.create_task(self._db_writer(out_q, results))
+        tasks = [*workers, writer]
+        
+        # Await both sides together: if the writer dies, workers blocked on
+        # the full out_q would otherwise wait forever
+        try:
+            await asyncio.gather(self._close_out_queue(workers, out_q), writer)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        
+        return results
+    
+    async def _close_out_queue(self, workers: List[asyncio.Task], out_q: asyncio.Queue) -> None:
+        """Send the writer its None sentinel once every scrape worker is done"""
+        await asyncio.gather(*workers)
+        await out_q.put(None)
+    
+    async def _scrape_worker(self, in_q: asyncio.Queue, out_q: asyncio.Queue,
+                             results: List[Optional[Dict]]) -> None:
+        """Scrape usernames from in_q until the None sentinel"""
+        while (item := await in_q.get()) is not None:
+            index, username = item
             logger.info(f"Processing profile: {username}")
             
-            try:
-                profile_data = await self.scrapfly_service.scrape_profile(username)
-                
-                if not profile_data:
-                    results.append({
-                        'username': username,
-                        'error': 'Failed to scrape profile',
-                        'success': False
-                    })
-                    continue
-                
-                profile_id = self.incremental_logic.get_or_create_profile(username, profile_data)
-                
-                should_create, change_analysis = self.incremental_logic.should_create_snapshot(
-                    profile_id, profile_data
-                )
-                
-                result = {
-                    'profile_id': profile_id,
-                    'username': username,
-                    'should_create_snapshot': should_create,
-                    'change_analysis': change_analysis,
-                    'success': True
-                }
-                
-                if should_create:
-                    snapshot_id = self.incremental_logic.create_snapshot(
-                        profile_id, profile_data, change_analysis
-                    )
-                    result['snapshot_id'] = snapshot_id
-                    logger.info(f"Created new snapshot for {username}: {change_analysis['reason']}")
-                else:
-                    logger.info(f"No new snapshot needed for {username}")
-                
-                results.append(result)
-                
-                await asyncio.sleep(2)  # Rate limiting
-                
-            except Exception as e:
-                logger.error(f"Failed to process {username}: {e}")
-                results.append({
+            profile_data = await self.scrapfly_service.scrape_profile(username)
+            
+            if profile_data:
+                await out_q.put((index, username, profile_data))
+            else:
+                results[index] = {
                     'username': username,
-                    'error': str(e),
+                    'error': 'Failed to scrape profile',
                     'success': False
-                })
-        
-        return results
+                }
     
-    def get_stats(self) -> Dict:
-        """Get scraping statistics"""
-        with self.db_manager.get_cursor() as cur:
-            cur.execute("SELECT COUNT(*) as total FROM profiles")
-            total_profiles = cur.fetchone()['total']
+    async def _db_writer(self, out_q: asyncio.Queue, results: List[Optional[Dict]]) -> None:
+        """Drain scraped profiles from out_q in batches until the None sentinel"""
+        done = False
+        while not done:
+            batch = [await out_q.get()]
+            while len(batch) < self.batch_size and not out_q.empty():
+                batch.append(out_q.get_nowait())
             
-            cur.execute("SELECT COUNT(*) as total FROM profile_snapshots")
-            total_snapshots = cur.fetchone()['total']
+            if batch[-1] is None:
+                done = True
+                batch.pop()
+            
+            if batch:
+                await self._write_batch(batch, results)
+    
+    async def _write_batch(self, batch: List[Tuple], results: List[Optional[Dict]]) -> None:
+        """Upsert a batch of profiles and COPY the snapshots that are due"""
+        outcomes = await asyncio.gather(*(
+            self.db_manager.upsert_and_fetch_last(
+                username, profile_data, self.incremental_logic.threshold_bp
+            )
+            for _, username, profile_data in batch
+        ), return_exceptions=True)
+        
+        due: List[Tuple] = []
+        
+        for (index, username, profile_data), outcome in zip(batch, outcomes):
+            if isinstance(outcome, Exception):
+                logger.error(f"Failed to process {username}: {outcome}")
+                results[index] = {
+                    'username': username,
+                    'error': str(outcome),
+                    'success': False
+                }
+                continue
             
-            cur.execute("SELECT COUNT(*) as changed FROM profile_snapshots WHERE change_detected = TRUE")
-            changed_snapshots = cur.fetchone()['changed']
+            profile_id, last_snapshot, changes = outcome
+            should_create, change_analysis = self.incremental_logic.decide_snapshot(last_snapshot, changes)
             
-            return {
-                'total_profiles': total_profiles,
-                'total_snapshots': total_snapshots,
-                'changed_snapshots': changed_snapshots
+            results[index] = {
+                'profile_id': profile_id,
+                'username': username,
+                'should_create_snapshot': should_create,
+                'change_analysis': change_analysis,
+                'success': True
             }
+            
+            if should_create:
+                anchor_id = last_snapshot['anchor_snapshot_id'] if last_snapshot else None
+                due.append((index, profile_id, profile_data, change_analysis, anchor_id))
+                logger.info(f"Queued new snapshot for {username}: {change_analysis['reason']}")
+            else:
+                logger.info(f"No new snapshot needed for {username}")
+        
+        pending_snapshots: List[tuple] = []
+        
+        try:
+            anchors = await self.incremental_logic.load_anchor_data(
+                [anchor_id for *_, anchor_id in due if anchor_id is not None]
+            )
+            for _, profile_id, profile_data, change_analysis, anchor_id in due:
+                pending_snapshots.append(self.incremental_logic.snapshot_record(
+                    profile_id, profile_data, change_analysis, anchor_id, anchors.get(anchor_id)
+                ))
+            
+            await self.incremental_logic.create_snapshots(pending_snapshots)
+        except Exception as e:
+            logger.error(f"Failed to write {len(due)} snapshots: {e}")
+            for index, *_ in due:
+                results[index] = {
+                    'username': results[index]['username'],
+                    'error': str(e),
+                    'success': False
+                }
+    
+    async def get_stats(self) -> Dict:
+        """Get scraping statistics"""
+        total_profiles = await self.db_manager.fetchval("SELECT COUNT(*) FROM profiles")
+        total_snapshots = await self.db_manager.fetchval("SELECT COUNT(*) FROM profile_snapshots")
+        changed_snapshots = await self.db_manager.fetchval(
+            "SELECT COUNT(*) FROM profile_snapshots WHERE change_detected = TRUE"
+        )
+        
+        return {
+            'total_profiles': total_profiles,
+            'total_snapshots': total_snapshots,
+            'changed_snapshots': changed_snapshots
+        }
 
 async def main():
     """Main execution function"""
     scraper = TikTokIncrementalScraper()
+    await scraper.db_manager.init_pool()
     
     # Example profiles to scrape - replace with your target profiles
     profiles_to_scrape = [
@@ -104,12 +185,17 @@ async def main():
     ]
     
     logger.info("Starting incremental TikTok scraping...")
-    results = await scraper.scrape_profiles(profiles_to_scrape)
-    
-    stats = scraper.get_stats()
-    logger.info(f"Scraping completed. Stats: {stats}")
+    try:
+        results = await scraper.scrape_profiles(profiles_to_scrape)
+        
+        stats = await scraper.get_stats()
+        logger.info(f"Scraping completed. Stats: {stats}")
+    finally:
+        await scraper.scrapfly_service.close()
+        await scraper.db_manager.close_pool()
     
     return results
 
 if __name__ == "__main__":
+    uvloop.install()
     asyncio.run(main())
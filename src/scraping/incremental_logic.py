@@ -1,75 +1,74 @@
 # src/scraping/incremental_logic.py
-from datetime import datetime, timedelta
-from typing import Dict, Optional, Tuple
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
 import logging
+import jsonpatch
 from src.database.models import DatabaseManager
 
 logger = logging.getLogger(__name__)
 
+METRICS = ('followers_count', 'following_count', 'likes_count', 'video_count')
+
+SNAPSHOT_COLUMNS = (
+    'profile_id', 'followers_count', 'following_count', 'likes_count',
+    'video_count', 'change_detected', 'previous_snapshot_id', 'raw_data',
+    'raw_data_first_id'
+)
+
 class IncrementalScraper:
-    def __init__(self, db_manager: DatabaseManager, change_threshold: float = 0.01):
+    def __init__(self, db_manager: DatabaseManager, change_threshold: float = 0.01,
+                 anchor_cache_size: int = 1000):
         self.db = db_manager
         self.change_threshold = change_threshold
+        # Threshold in basis points; every change check (here and in SQL)
+        # compares |change| * 10000 >= threshold_bp * old in integers
+        self.threshold_bp = round(change_threshold * 10000)
+        # LRU of anchor snapshot id -> full raw_data; anchors are never rewritten
+        self.anchor_cache_size = anchor_cache_size
+        self._anchor_cache: OrderedDict[int, Dict] = OrderedDict()
     
-    def get_or_create_profile(self, username: str, profile_data: Dict) -> int:
+    async def get_or_create_profile(self, username: str, profile_data: Dict) -> int:
         """Get existing profile ID or create new profile"""
-        with self.db.get_cursor(commit=True) as cur:
-            cur.execute(
-                "SELECT id FROM profiles WHERE username = %s",
-                (username.lower(),)
-            )
-            result = cur.fetchone()
-            
-            if result:
-                profile_id = result['id']
-                cur.execute(
-                    "UPDATE profiles SET last_checked = %s WHERE id = %s",
-                    (datetime.now(), profile_id)
+        async with self.db.pool.acquire() as conn:
+            async with conn.transaction():
+                profile_id = await conn.fetchval(
+                    "SELECT id FROM profiles WHERE username = $1",
+                    username.lower()
                 )
-                return profile_id
-            else:
-                cur.execute(
-                    """
-                    INSERT INTO profiles 
-                    (username, profile_id, display_name, bio, avatar_url, verified, last_checked)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s)
-                    RETURNING id
-                    """,
-                    (
+                
+                if profile_id:
+                    await conn.execute(
+                        "UPDATE profiles SET last_checked = CURRENT_TIMESTAMP WHERE id = $1",
+                        profile_id
+                    )
+                    return profile_id
+                else:
+                    return await conn.fetchval(
+                        """
+                        INSERT INTO profiles 
+                        (username, profile_id, display_name, bio, avatar_url, verified, last_checked)
+                        VALUES ($1, $2, $3, $4, $5, $6, CURRENT_TIMESTAMP)
+                        RETURNING id
+                        """,
                         username.lower(),
                         profile_data.get('profile_id'),
                         profile_data.get('display_name'),
                         profile_data.get('bio'),
                         profile_data.get('avatar_url'),
-                        profile_data.get('verified', False),
-                        datetime.now()
+                        profile_data.get('verified', False)
                     )
-                )
-                new_profile = cur.fetchone()
-                return new_profile['id']
     
-    def get_last_snapshot(self, profile_id: int) -> Optional[Dict]:
+    async def get_last_snapshot(self, profile_id: int) -> Optional[Dict]:
         """Get the most recent snapshot for a profile"""
-        with self.db.get_cursor() as cur:
-            cur.execute(
-                """
-                SELECT * FROM profile_snapshots 
-                WHERE profile_id = %s 
-                ORDER BY snapshot_timestamp DESC 
-                LIMIT 1
-                """,
-                (profile_id,)
-            )
-            return cur.fetchone()
+        return await self.db.fetchrow_named('last_snapshot', profile_id)
     
     def calculate_changes(self, current_data: Dict, last_snapshot: Dict) -> Tuple[bool, Dict]:
         """Calculate changes between current data and last snapshot"""
         changes = {}
         has_changed = False
         
-        metrics = ['followers_count', 'following_count', 'likes_count', 'video_count']
-        
-        for metric in metrics:
+        for metric in METRICS:
             current_val = current_data.get(metric, 0)
             last_val = last_snapshot.get(metric, 0)
             
@@ -83,29 +82,38 @@ class IncrementalScraper:
                 has_changed = True
             elif last_val > 0:
                 absolute_change = current_val - last_val
-                percentage_change = (absolute_change / last_val) * 100
                 
-                if abs(percentage_change) >= (self.change_threshold * 100):
+                # |change| / last >= threshold, cross-multiplied in basis points
+                if abs(absolute_change) * 10000 >= self.threshold_bp * last_val:
                     changes[metric] = {
                         'old_value': last_val,
                         'new_value': current_val,
                         'absolute_change': absolute_change,
-                        'percentage_change': percentage_change
+                        'percentage_change': (absolute_change / last_val) * 100
                     }
                     has_changed = True
         
         return has_changed, changes
     
-    def should_create_snapshot(self, profile_id: int, current_data: Dict) -> Tuple[bool, Dict]:
+    async def should_create_snapshot(self, profile_id: int, current_data: Dict) -> Tuple[bool, Dict]:
         """Determine if we should create a new snapshot"""
-        last_snapshot = self.get_last_snapshot(profile_id)
-        
+        last_snapshot = await self.get_last_snapshot(profile_id)
+        return self.analyze_snapshot(current_data, last_snapshot)
+    
+    def analyze_snapshot(self, current_data: Dict, last_snapshot: Optional[Dict]) -> Tuple[bool, Dict]:
+        """Decide on a new snapshot given the already-fetched last snapshot"""
         if not last_snapshot:
             return True, {'reason': 'first_snapshot'}
         
-        has_changed, changes = self.calculate_changes(current_data, last_snapshot)
+        _, changes = self.calculate_changes(current_data, last_snapshot)
+        return self.decide_snapshot(last_snapshot, changes)
+    
+    def decide_snapshot(self, last_snapshot: Optional[Dict], changes: Dict) -> Tuple[bool, Dict]:
+        """Decide on a new snapshot from already-computed metric changes"""
+        if not last_snapshot:
+            return True, {'reason': 'first_snapshot'}
         
-        if has_changed:
+        if changes:
             return True, {
                 'reason': 'metrics_changed',
                 'changes': changes,
@@ -113,7 +121,7 @@ class IncrementalScraper:
             }
         
         last_timestamp = last_snapshot['snapshot_timestamp']
-        time_since_last = datetime.now() - last_timestamp
+        time_since_last = datetime.now(timezone.utc) - last_timestamp
         
         if time_since_last > timedelta(days=7):
             return True, {
@@ -123,28 +131,86 @@ class IncrementalScraper:
         
         return False, {'reason': 'no_significant_changes'}
     
-    def create_snapshot(self, profile_id: int, profile_data: Dict, change_analysis: Dict) -> int:
-        """Create a new snapshot in the database"""
-        with self.db.get_cursor(commit=True) as cur:
-            cur.execute(
-                """
-                INSERT INTO profile_snapshots 
-                (profile_id, followers_count, following_count, likes_count, 
-                 video_count, change_detected, previous_snapshot_id, raw_data)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                RETURNING id
-                """,
-                (
-                    profile_id,
-                    profile_data.get('followers_count'),
-                    profile_data.get('following_count'),
-                    profile_data.get('likes_count'),
-                    profile_data.get('video_count'),
-                    change_analysis['reason'] != 'no_significant_changes',
-                    change_analysis.get('previous_snapshot_id'),
-                    profile_data.get('raw_data')
-                )
+    async def load_anchor_data(self, anchor_ids: List[int]) -> Dict[int, Dict]:
+        """Get the full raw_data of anchor snapshots, fetching misses in one query"""
+        found = {}
+        missing = []
+        for anchor_id in set(anchor_ids):
+            if anchor_id in self._anchor_cache:
+                self._anchor_cache.move_to_end(anchor_id)
+                found[anchor_id] = self._anchor_cache[anchor_id]
+            else:
+                missing.append(anchor_id)
+        
+        if missing:
+            rows = await self.db.fetch(
+                "SELECT id, raw_data FROM profile_snapshots WHERE id = ANY($1::integer[])",
+                missing
             )
-            snapshot = cur.fetchone()
-            logger.info(f"Created snapshot {snapshot['id']} for profile {profile_id}")
-            return snapshot['id']
+            for row in rows:
+                found[row['id']] = row['raw_data']
+                self._anchor_cache[row['id']] = row['raw_data']
+            while len(self._anchor_cache) > self.anchor_cache_size:
+                self._anchor_cache.popitem(last=False)
+        
+        # Built from found, so entries evicted above are still returned
+        return {anchor_id: found.get(anchor_id) for anchor_id in anchor_ids}
+    
+    async def get_raw_data(self, snapshot_id: int) -> Optional[Dict]:
+        """Reconstruct a snapshot's full raw_data from its anchor and patch"""
+        snapshot = await self.db.fetchrow(
+            "SELECT raw_data, raw_data_first_id FROM profile_snapshots WHERE id = $1",
+            snapshot_id
+        )
+        if not snapshot:
+            return None
+        if snapshot['raw_data_first_id'] is None:
+            return snapshot['raw_data']
+        
+        anchor_id = snapshot['raw_data_first_id']
+        anchor_data = (await self.load_anchor_data([anchor_id]))[anchor_id]
+        return jsonpatch.apply_patch(anchor_data, snapshot['raw_data']['patch'])
+    
+    def snapshot_record(self, profile_id: int, profile_data: Dict, change_analysis: Dict,
+                        anchor_id: Optional[int] = None, anchor_data: Optional[Dict] = None) -> Tuple:
+        """Build a snapshot row in SNAPSHOT_COLUMNS order
+        
+        With an anchor, raw_data is stored as a JSON patch against the
+        anchor's full raw_data instead of a full copy.
+        """
+        raw_data = profile_data.get('raw_data')
+        if anchor_id is not None and anchor_data is not None and raw_data is not None:
+            raw_data = {
+                'anchor': anchor_id,
+                'patch': jsonpatch.make_patch(anchor_data, raw_data).patch
+            }
+        else:
+            anchor_id = None
+        
+        return (
+            profile_id,
+            profile_data.get('followers_count'),
+            profile_data.get('following_count'),
+            profile_data.get('likes_count'),
+            profile_data.get('video_count'),
+            change_analysis['reason'] != 'no_significant_changes',
+            change_analysis.get('previous_snapshot_id'),
+            raw_data,
+            anchor_id
+        )
+    
+    async def create_snapshots(self, records: List[Tuple]) -> None:
+        """Insert a batch of snapshot rows in one COPY"""
+        if not records:
+            return
+        await self.db.copy_records('profile_snapshots', records, SNAPSHOT_COLUMNS)
+        logger.info(f"Created {len(records)} snapshots")
+    
+    async def create_snapshot(self, profile_id: int, profile_data: Dict, change_analysis: Dict) -> int:
+        """Create a new snapshot in the database"""
+        anchor_id = await self.db.fetchval_named('anchor_snapshot', profile_id)
+        anchor_data = (await self.load_anchor_data([anchor_id]))[anchor_id] if anchor_id else None
+        record = self.snapshot_record(profile_id, profile_data, change_analysis, anchor_id, anchor_data)
+        snapshot_id = await self.db.fetchval_named('insert_snapshot', *record)
+        logger.info(f"Created snapshot {snapshot_id} for profile {profile_id}")
+        return snapshot_id
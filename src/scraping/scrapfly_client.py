@@ -1,55 +1,145 @@
 # src/scraping/scrapfly_client.py
 import os
-from scrapfly import ScrapeConfig, ScrapflyClient, ScrapeApiResponse
+import re
+import time
+import asyncio
+import aiohttp
+import orjson
 from typing import List, Dict, Optional
 import logging
 
 logger = logging.getLogger(__name__)
 
+SCRAPFLY_API_URL = "https://api.scrapfly.io/scrape"
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+# Opening tag of the script holding TikTok's hydration JSON
+UNIVERSAL_DATA_RE = re.compile(r'<script[^>]*id="__UNIVERSAL_DATA_FOR_REHYDRATION__"[^>]*>')
+
+class RateLimiter:
+    """Token bucket that paces scrape requests and backs off on API hints"""
+    
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+    
+    async def acquire(self):
+        """Wait until a request may be sent"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+    
+    def update_from_headers(self, headers):
+        """Adjust pacing from Scrapfly response headers"""
+        retry_after = headers.get('Retry-After')
+        if retry_after and retry_after.isdigit():
+            self.paused_until = max(self.paused_until, time.monotonic() + int(retry_after))
+        
+        remaining = headers.get('X-Scrapfly-Account-Remaining-Concurrent-Usage')
+        if remaining is not None and remaining.isdigit() and int(remaining) == 0:
+            self.tokens = 0.0
+
 class ScrapflyService:
-    def __init__(self):
+    def __init__(self, requests_per_second: float = 2.0, burst: int = 16, max_retries: int = 3):
         self.api_key = os.getenv('SCRAPFLY_API_KEY')
         if not self.api_key:
             raise ValueError("SCRAPFLY_API_KEY environment variable is required")
         
-        self.client = ScrapflyClient(key=self.api_key)
         self.base_config = {
-            "asp": True,  # Anti-scraping protection
+            "asp": "true",  # Anti-scraping protection
             "country": "US",  # Proxy country
-            "render_js": True,  # JavaScript rendering
+            "render_js": "true",  # JavaScript rendering
             "proxy_pool": "public_residential_pool"  # Use residential proxies
         }
+        self.rate_limiter = RateLimiter(requests_per_second, burst)
+        self.max_retries = max_retries
+        self._session: Optional[aiohttp.ClientSession] = None
+    
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Lazily create the shared session so TCP/TLS connections are reused"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=64, limit_per_host=16, ttl_dns_cache=300),
+                # Scrapfly allows up to 150s for an ASP + JS rendered scrape
+                timeout=aiohttp.ClientTimeout(total=155)
+            )
+        return self._session
+    
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+    
+    async def _fetch(self, url: str) -> Dict:
+        """Call the Scrapfly scrape API, retrying transient failures with backoff"""
+        params = {"key": self.api_key, "url": url, **self.base_config}
+        
+        for attempt in range(self.max_retries + 1):
+            await self.rate_limiter.acquire()
+            try:
+                async with self._get_session().get(SCRAPFLY_API_URL, params=params) as response:
+                    self.rate_limiter.update_from_headers(response.headers)
+                    body = await response.read()
+                    
+                    if response.status not in RETRYABLE_STATUSES:
+                        return orjson.loads(body)
+                    
+                    logger.warning(f"Scrapfly returned {response.status} for {url}")
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.warning(f"Scrapfly request failed for {url}: {e}")
+            
+            if attempt < self.max_retries:
+                await asyncio.sleep(2 ** attempt)
+        
+        raise RuntimeError(f"Scrapfly request failed after {self.max_retries + 1} attempts")
     
     async def scrape_profile(self, username: str) -> Optional[Dict]:
         """Scrape TikTok profile data using Scrapfly"""
         try:
             url = f"https://www.tiktok.com/@{username.lstrip('@')}"
             
-            response: ScrapeApiResponse = await self.client.async_scrape(
-                ScrapeConfig(url, **self.base_config)
-            )
+            data = await self._fetch(url)
+            result = data.get('result') or {}
             
-            if response.success:
-                return self._parse_profile_data(response, username)
+            if result.get('success'):
+                return self._parse_profile_data(result['content'], username)
             else:
-                logger.error(f"Scrapfly error for {username}: {response.scrape_result['error']}")
+                logger.error(f"Scrapfly error for {username}: {result.get('error') or data.get('message')}")
                 return None
                 
         except Exception as e:
             logger.error(f"Error scraping profile {username}: {e}")
             return None
     
-    def _parse_profile_data(self, response: ScrapeApiResponse, username: str) -> Dict:
-        """Parse profile data from Scrapfly response"""
+    def _parse_profile_data(self, content: str, username: str) -> Dict:
+        """Parse profile data from the scraped page HTML"""
         try:
-            selector = response.selector
-            script_data = selector.xpath("//script[@id='__UNIVERSAL_DATA_FOR_REHYDRATION__']/text()").get()
+            # Slice the one known script out of the page rather than building
+            # a DOM for hundreds of KB of HTML
+            match = UNIVERSAL_DATA_RE.search(content)
+            end = content.find('</script>', match.end()) if match else -1
             
-            if not script_data:
+            if end == -1:
                 raise ValueError("No universal data found")
             
-            import json
-            data = json.loads(script_data)
+            script_data = content[match.end():end]
+            
+            data = orjson.loads(script_data)
             user_info = data["__DEFAULT_SCOPE__"]["webapp.user-detail"]["userInfo"]["user"]
             
             return {
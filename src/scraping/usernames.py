@@ -0,0 +1,17 @@
+# src/scraping/usernames.py
+import re
+from typing import List
+
+# TikTok usernames: up to 30 letters, digits, underscores and periods
+USERNAME_RE = re.compile(r'@?([A-Za-z0-9._]{1,30})')
+# Profiles may be separated by commas, spaces or newlines
+SEPARATOR_RE = re.compile(r'[\s,]+')
+
+def parse_usernames(text: str) -> List[str]:
+    """Split text into lowercase usernames; tokens that aren't one are dropped"""
+    usernames = []
+    for token in SEPARATOR_RE.split(text):
+        match = USERNAME_RE.fullmatch(token)
+        if match:
+            usernames.append(match.group(1).lower())
+    return list(dict.fromkeys(usernames))
@@ -1,21 +1,49 @@
 # src/web_app.py
 import os
+import uuid
 import asyncio
 import logging
+import threading
+import uvloop
+from arq import create_pool
+from arq.jobs import Job, JobStatus
 from flask import Flask, render_template, request, jsonify, session
 from src.database.models import DatabaseManager
-from src.scraping.scrapfly_client import ScrapflyService
-from src.scraping.incremental_logic import IncrementalScraper
+from src.config import REDIS_SETTINGS
+from src.scraping.usernames import parse_usernames
 import json
-from datetime import datetime
 
 app = Flask(__name__)
 app.secret_key = os.getenv('FLASK_SECRET', 'dev-secret-key')
 
-# Initialize components
+# Initialize components; scraping itself runs in the arq worker (src/worker.py)
 db_manager = DatabaseManager()
-scrapfly_service = ScrapflyService()
-incremental_scraper = IncrementalScraper(db_manager)
+redis_pool = None
+redis_pool_lock = asyncio.Lock()
+
+# The asyncpg pool is bound to one event loop, so all async work for this
+# process runs on a single long-lived loop in a background thread
+loop = uvloop.new_event_loop()
+threading.Thread(target=loop.run_forever, daemon=True).start()
+
+def run_async(coro):
+    """Run a coroutine on the background loop and wait for its result"""
+    return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+def get_session_id():
+    """Get this browser session's id, assigning one on first use"""
+    if 'session_id' not in session:
+        session['session_id'] = uuid.uuid4().hex
+    return session['session_id']
+
+async def get_redis():
+    """Get the arq Redis pool, creating it on first use"""
+    global redis_pool
+    # Concurrent first requests must not each create (and leak) a pool
+    async with redis_pool_lock:
+        if redis_pool is None:
+            redis_pool = await create_pool(REDIS_SETTINGS)
+    return redis_pool
 
 @app.route('/')
 def index():
@@ -24,28 +52,21 @@ def index():
 
 @app.route('/profiles', methods=['POST'])
 def add_profiles():
-    """Add new profiles to monitor"""
+    """Set the profiles to monitor, replacing any previous list"""
     try:
         profiles_text = request.json.get('profiles', '')
         
-        # Parse profiles (support comma, newline, or space separation)
-        profiles = []
-        for line in profiles_text.split('\n'):
-            line_profiles = [p.strip().lstrip('@') for p in line.replace(',', ' ').split() if p.strip()]
-            profiles.extend(line_profiles)
-        
-        profiles = list(set(profiles))  # Remove duplicates
+        # Parse profiles, dropping invalid tokens and duplicates but keeping order
+        profiles = parse_usernames(profiles_text)
         
         if not profiles:
             return jsonify({'success': False, 'error': 'No valid profiles provided'})
         
-        # Store profiles in session (in production, use database)
-        session['monitored_profiles'] = profiles
-        session.modified = True
+        run_async(save_monitored_profiles(get_session_id(), profiles))
         
         return jsonify({
             'success': True, 
-            'message': f'Added {len(profiles)} profiles to monitor',
+            'message': f'Monitoring {len(profiles)} profiles',
             'profiles': profiles
         })
         
@@ -55,9 +76,9 @@ def add_profiles():
 
 @app.route('/scrape', methods=['POST'])
 def scrape_profiles():
-    """Run scraping on monitored profiles"""
+    """Queue scraping of monitored profiles on the background worker"""
     try:
-        profiles = session.get('monitored_profiles', [])
+        profiles = run_async(load_monitored_profiles(get_session_id()))
         
         if not profiles:
             return jsonify({
@@ -65,106 +86,96 @@ def scrape_profiles():
                 'error': 'No profiles to scrape. Add profiles first.'
             })
         
-        # Run scraping asynchronously
-        results = asyncio.run(run_scraping(profiles))
+        job = run_async(enqueue_scrape(profiles))
         
         return jsonify({
             'success': True,
-            'message': f'Scraped {len(results)} profiles',
-            'results': results,
-            'timestamp': datetime.now().isoformat()
+            'message': f'Queued scraping of {len(profiles)} profiles',
+            'job_id': job.job_id
         })
         
     except Exception as e:
         logging.error(f"Error scraping profiles: {e}")
         return jsonify({'success': False, 'error': str(e)})
 
+@app.route('/jobs/<job_id>')
+def get_job(job_id):
+    """Get the status, and once finished the results, of a scraping job"""
+    try:
+        return jsonify(run_async(get_job_state(job_id)))
+        
+    except Exception as e:
+        logging.error(f"Error getting job {job_id}: {e}")
+        return jsonify({'error': str(e)})
+
 @app.route('/status')
 def get_status():
     """Get scraping status and statistics"""
     try:
-        with db_manager.get_cursor() as cur:
-            # Get profile count
-            cur.execute("SELECT COUNT(*) as total FROM profiles")
-            total_profiles = cur.fetchone()['total']
-            
-            # Get snapshot count
-            cur.execute("SELECT COUNT(*) as total FROM profile_snapshots")
-            total_snapshots = cur.fetchone()['total']
-            
-            # Get recent activity
-            cur.execute("""
-                SELECT COUNT(*) as recent 
-                FROM profile_snapshots 
-                WHERE snapshot_timestamp > NOW() - INTERVAL '1 day'
-            """)
-            recent_snapshots = cur.fetchone()['recent']
+        total_profiles, total_snapshots, recent_snapshots = run_async(get_counts())
+        monitored_profiles = run_async(load_monitored_profiles(get_session_id()))
             
         return jsonify({
             'total_profiles': total_profiles,
             'total_snapshots': total_snapshots,
             'recent_snapshots_24h': recent_snapshots,
-            'monitored_profiles': session.get('monitored_profiles', [])
+            'monitored_profiles': monitored_profiles
         })
         
     except Exception as e:
         logging.error(f"Error getting status: {e}")
         return jsonify({'error': str(e)})
 
-async def run_scraping(profiles):
-    """Run the scraping process"""
-    scraper = type('Scraper', (), {})()  # Simple container
-    scraper.db_manager = db_manager
-    scraper.scraply_service = scrapfly_service  
-    scraper.incremental_logic = incremental_scraper
+async def get_counts():
+    """Get profile, snapshot and recent snapshot counts"""
+    await db_manager.init_pool()
     
-    results = []
+    # Get profile count
+    total_profiles = await db_manager.fetchval("SELECT COUNT(*) FROM profiles")
     
-    for username in profiles:
-        try:
-            logging.info(f"Scraping profile: {username}")
-            profile_data = await scrapfly_service.scrape_profile(username)
-            
-            if not profile_data:
-                results.append({
-                    'username': username,
-                    'status': 'failed',
-                    'error': 'Failed to scrape profile'
-                })
-                continue
-            
-            profile_id = incremental_scraper.get_or_create_profile(username, profile_data)
-            
-            should_create, change_analysis = incremental_scraper.should_create_snapshot(
-                profile_id, profile_data
-            )
-            
-            result = {
-                'username': username,
-                'status': 'success',
-                'profile_id': profile_id,
-                'new_snapshot': should_create,
-                'reason': change_analysis['reason']
-            }
-            
-            if should_create:
-                snapshot_id = incremental_scraper.create_snapshot(
-                    profile_id, profile_data, change_analysis
-                )
-                result['snapshot_id'] = snapshot_id
-            
-            results.append(result)
-            await asyncio.sleep(2)  # Rate limiting
-            
-        except Exception as e:
-            logging.error(f"Failed to process {username}: {e}")
-            results.append({
-                'username': username,
-                'status': 'error', 
-                'error': str(e)
-            })
+    # Get snapshot count
+    total_snapshots = await db_manager.fetchval("SELECT COUNT(*) FROM profile_snapshots")
+    
+    # Get recent activity
+    recent_snapshots = await db_manager.fetchval("""
+        SELECT COUNT(*) 
+        FROM profile_snapshots 
+        WHERE snapshot_timestamp > NOW() - INTERVAL '1 day'
+    """)
+    
+    return total_profiles, total_snapshots, recent_snapshots
+
+async def save_monitored_profiles(session_id, profiles):
+    """Replace the session's monitored profiles"""
+    await db_manager.init_pool()
+    await db_manager.set_monitored_profiles(session_id, profiles)
+
+async def load_monitored_profiles(session_id):
+    """Get the session's monitored profiles"""
+    await db_manager.init_pool()
+    return await db_manager.get_monitored_profiles(session_id)
+
+async def enqueue_scrape(profiles):
+    """Enqueue a scrape_job for the worker"""
+    redis = await get_redis()
+    return await redis.enqueue_job('scrape_job', profiles)
+
+async def get_job_state(job_id):
+    """Look up a job's status and, once complete, its outcome"""
+    job = Job(job_id, await get_redis())
+    status = await job.status()
+    state = {'job_id': job_id, 'status': status.value}
+    
+    if status == JobStatus.complete:
+        info = await job.result_info()
+        state['success'] = info.success
+        state['timestamp'] = info.finish_time.isoformat()
+        if info.success:
+            state['results'] = info.result
+        else:
+            state['error'] = str(info.result)
     
-    return results
+    return state
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=False)
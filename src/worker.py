@@ -0,0 +1,36 @@
+# src/worker.py
+import uvloop
+from arq import cron
+from src.config import REDIS_SETTINGS
+from src.main import TikTokIncrementalScraper
+
+# arq creates its event loop after importing this module
+uvloop.install()
+
+async def startup(ctx):
+    """Create the scraper with its DB pool and HTTP session once per worker"""
+    scraper = TikTokIncrementalScraper()
+    await scraper.db_manager.init_pool()
+    ctx['scraper'] = scraper
+
+async def shutdown(ctx):
+    scraper = ctx['scraper']
+    await scraper.scrapfly_service.close()
+    await scraper.db_manager.close_pool()
+
+async def scrape_job(ctx, profiles):
+    """Scrape the given profiles and return per-profile results"""
+    return await ctx['scraper'].scrape_profiles(profiles)
+
+async def expire_monitored_profiles(ctx):
+    """Drop monitored lists of sessions that stopped using them"""
+    return await ctx['scraper'].db_manager.expire_monitored_profiles()
+
+class WorkerSettings:
+    functions = [scrape_job]
+    # Daily, off the request path, so saves never lock other sessions' rows
+    cron_jobs = [cron(expire_monitored_profiles, hour=3, minute=0)]
+    on_startup = startup
+    on_shutdown = shutdown
+    redis_settings = REDIS_SETTINGS
+    job_timeout = 3600
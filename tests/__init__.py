@@ -0,0 +1,2 @@
+# tests/__init__.py
+# Empty file - marks directory as Python package
@@ -0,0 +1,6 @@
+# tests/conftest.py
+import os
+import sys
+
+# Add src to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
@@ -0,0 +1,48 @@
+# tests/test_monitored_profiles.py
+import os
+import asyncio
+import pytest
+
+pytest.importorskip('asyncpg')
+
+from src.database.models import DatabaseManager
+
+TEST_DATABASE_URL = os.getenv('TEST_DATABASE_URL')
+
+pytestmark = pytest.mark.skipif(
+    not TEST_DATABASE_URL, reason="TEST_DATABASE_URL is not set (needs a disposable Postgres)"
+)
+
+SESSIONS = ['monitored_test_active', 'monitored_test_idle']
+
+async def _monitored_profiles():
+    db = DatabaseManager()
+    db.database_url = TEST_DATABASE_URL
+    await db.init_db()
+    await db.init_pool()
+    active, idle = SESSIONS
+
+    try:
+        # Saving replaces the list and keeps the submitted order
+        await db.set_monitored_profiles(active, ['zed', 'alpha', 'mid'])
+        await db.set_monitored_profiles(active, ['bob', 'zed'])
+        assert await db.get_monitored_profiles(active) == ['bob', 'zed']
+
+        # Both lists were saved long ago, but only the active one is still read
+        await db.set_monitored_profiles(idle, ['carol'])
+        await db.execute(
+            "UPDATE monitored_profiles SET added_at = NOW() - INTERVAL '60 days', "
+            "last_used_at = NOW() - INTERVAL '60 days' WHERE session_id = ANY($1::text[])",
+            SESSIONS
+        )
+        assert await db.get_monitored_profiles(active) == ['bob', 'zed']
+
+        await db.expire_monitored_profiles()
+        assert await db.get_monitored_profiles(active) == ['bob', 'zed']
+        assert await db.get_monitored_profiles(idle) == []
+    finally:
+        await db.execute("DELETE FROM monitored_profiles WHERE session_id = ANY($1::text[])", SESSIONS)
+        await db.close_pool()
+
+def test_monitored_lists_expire_only_when_unused():
+    asyncio.run(_monitored_profiles())
@@ -0,0 +1,81 @@
+# tests/test_scrape_pipeline.py
+import asyncio
+import pytest
+
+pytest.importorskip('uvloop')
+pytest.importorskip('aiohttp')
+
+from src.main import TikTokIncrementalScraper
+
+USERNAMES = [f'user{i}' for i in range(10)]
+
+class FakeScrapfly:
+    """Returns a profile per username, finishing out of input order"""
+
+    async def scrape_profile(self, username):
+        await asyncio.sleep((9 - int(username.removeprefix('user')) % 10) / 1000)
+        return {'followers_count': 10, 'raw_data': {'username': username}}
+
+class FakeDatabase:
+    def __init__(self, fail_for=()):
+        self.fail_for = set(fail_for)
+        self.profile_ids = {}
+
+    async def upsert_and_fetch_last(self, username, profile_data, threshold_bp):
+        if username in self.fail_for:
+            raise RuntimeError(f'upsert failed for {username}')
+        profile_id = self.profile_ids.setdefault(username, len(self.profile_ids) + 1)
+        return profile_id, None, {}
+
+def make_scraper(monkeypatch, db=None, **kwargs):
+    monkeypatch.setenv('SCRAPFLY_API_KEY', 'test-key')
+    scraper = TikTokIncrementalScraper(**kwargs)
+    scraper.scrapfly_service = FakeScrapfly()
+    scraper.db_manager = db or FakeDatabase()
+    scraper.incremental_logic.db = scraper.db_manager
+
+    scraper.created = []
+    async def create_snapshots(records):
+        scraper.created.extend(records)
+    monkeypatch.setattr(scraper.incremental_logic, 'create_snapshots', create_snapshots)
+    return scraper
+
+def run(coro):
+    # A hang fails the test instead of blocking the suite
+    return asyncio.run(asyncio.wait_for(coro, timeout=5))
+
+def test_results_keep_input_order_across_batches(monkeypatch):
+    scraper = make_scraper(monkeypatch, batch_size=3, workers=4, queue_size=2)
+
+    results = run(scraper.scrape_profiles(USERNAMES))
+
+    assert [result['username'] for result in results] == USERNAMES
+    assert all(result['success'] for result in results)
+    assert len(scraper.created) == len(USERNAMES)
+
+def test_upsert_failure_marks_only_that_profile(monkeypatch):
+    db = FakeDatabase(fail_for={'user3'})
+    scraper = make_scraper(monkeypatch, db=db, batch_size=4, workers=2)
+
+    results = run(scraper.scrape_profiles(USERNAMES))
+
+    assert results[3] == {
+        'username': 'user3', 'error': 'upsert failed for user3', 'success': False
+    }
+    assert all(result['success'] for i, result in enumerate(results) if i != 3)
+    assert len(scraper.created) == len(USERNAMES) - 1
+
+def test_empty_input(monkeypatch):
+    scraper = make_scraper(monkeypatch)
+
+    assert run(scraper.scrape_profiles([])) == []
+    assert scraper.created == []
+
+def test_writer_exception_propagates_instead_of_hanging(monkeypatch):
+    scraper = make_scraper(monkeypatch, batch_size=1, workers=4, queue_size=1)
+    def decide_snapshot(last_snapshot, changes):
+        raise RuntimeError('writer died')
+    monkeypatch.setattr(scraper.incremental_logic, 'decide_snapshot', decide_snapshot)
+
+    with pytest.raises(RuntimeError, match='writer died'):
+        run(scraper.scrape_profiles(USERNAMES * 5))
@@ -0,0 +1,67 @@
+# tests/test_snapshot_copy.py
+import os
+import asyncio
+import pytest
+
+pytest.importorskip('asyncpg')
+
+from src.database.models import DatabaseManager
+from src.scraping.incremental_logic import IncrementalScraper
+
+TEST_DATABASE_URL = os.getenv('TEST_DATABASE_URL')
+
+pytestmark = pytest.mark.skipif(
+    not TEST_DATABASE_URL, reason="TEST_DATABASE_URL is not set (needs a disposable Postgres)"
+)
+
+USERNAME = 'copy_test_profile'
+
+async def _copy_snapshots():
+    db = DatabaseManager()
+    db.database_url = TEST_DATABASE_URL
+    await db.init_db()
+    await db.init_pool()
+    scraper = IncrementalScraper(db)
+    
+    try:
+        first = {'followers_count': 10, 'raw_data': {'id': '1', 'stats': {'followers': 10}}}
+        profile_id, last_snapshot, _ = await db.upsert_and_fetch_last(USERNAME, first, 100)
+        assert last_snapshot is None
+        
+        # First snapshot through COPY keeps the full raw_data
+        await scraper.create_snapshots([
+            scraper.snapshot_record(profile_id, first, {'reason': 'first_snapshot'})
+        ])
+        
+        second = {'followers_count': 20, 'raw_data': {'id': '1', 'stats': {'followers': 20}}}
+        _, last_snapshot, changes = await db.upsert_and_fetch_last(USERNAME, second, 100)
+        assert set(changes) == {'followers_count'}
+        
+        # Later snapshots go through COPY as a patch against the anchor
+        anchor_id = last_snapshot['anchor_snapshot_id']
+        anchors = await scraper.load_anchor_data([anchor_id])
+        await scraper.create_snapshots([
+            scraper.snapshot_record(
+                profile_id, second, {'reason': 'metrics_changed'}, anchor_id, anchors[anchor_id]
+            )
+        ])
+        
+        rows = await db.fetch(
+            "SELECT id, raw_data, raw_data_first_id FROM profile_snapshots "
+            "WHERE profile_id = $1 ORDER BY snapshot_timestamp",
+            profile_id
+        )
+        assert [row['raw_data_first_id'] for row in rows] == [None, anchor_id]
+        assert rows[0]['raw_data'] == first['raw_data']
+        assert await scraper.get_raw_data(rows[1]['id']) == second['raw_data']
+    finally:
+        await db.execute(
+            "DELETE FROM profile_snapshots WHERE profile_id IN "
+            "(SELECT id FROM profiles WHERE username = $1)",
+            USERNAME
+        )
+        await db.execute("DELETE FROM profiles WHERE username = $1", USERNAME)
+        await db.close_pool()
+
+def test_copy_writes_snapshots_with_jsonb_raw_data():
+    asyncio.run(_copy_snapshots())
@@ -0,0 +1,29 @@
+# tests/test_usernames.py
+from src.scraping.usernames import parse_usernames
+
+def test_dedupes_keeping_first_occurrence_order():
+    assert parse_usernames('carol, alice, carol, bob, alice') == ['carol', 'alice', 'bob']
+
+def test_lowercases_and_dedupes_case_insensitively():
+    assert parse_usernames('Alice ALICE alice') == ['alice']
+
+def test_strips_leading_at():
+    assert parse_usernames('@alice @Bob') == ['alice', 'bob']
+
+def test_splits_on_commas_spaces_and_newlines():
+    text = 'alice,bob carol\ndave,\n  eve ,, frank\t\n'
+    assert parse_usernames(text) == ['alice', 'bob', 'carol', 'dave', 'eve', 'frank']
+
+def test_keeps_periods_and_underscores():
+    assert parse_usernames('john.doe_99') == ['john.doe_99']
+
+def test_rejects_malformed_tokens_instead_of_fragmenting_them():
+    text = 'bad-name https://www.tiktok.com/@alice ' + 'a' * 31 + ' @@bob ok'
+    assert parse_usernames(text) == ['ok']
+
+def test_accepts_thirty_characters():
+    assert parse_usernames('a' * 30) == ['a' * 30]
+
+def test_empty_input():
+    assert parse_usernames('') == []
+    assert parse_usernames(' ,\n') == []